@@ -1,34 +1,114 @@
 # ============================================================
 # Clinical Aggregator API
-# API simples em Flask para extrair texto de notas clínicas
-# Usa Google Gemini 1.5 Flash
+# API simples em Quart (async) para extrair texto de notas clínicas
+# Usa Google Gemini 2.0 Flash
 # ============================================================
 
 import os
+import io
+import concurrent.futures
 import json
+import time
+import asyncio
+import hashlib
 import logging
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+from quart import Quart, request
+from quart.wrappers import Request
+from quart_cors import cors
 from google import genai
-from google.genai import types
+from google.genai import errors, types
+from tenacity import (
+    retry, retry_if_exception, stop_after_attempt,
+    wait_random_exponential, before_sleep_log
+)
 import base64
+import orjson
+import pymupdf
+from PIL import Image, ImageOps
+import llm_cache
+import prefilter
+import semantic_cache
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Inicializa Flask
-app = Flask(__name__)
+# Inicializa Quart (API compatível com Flask, mas assíncrona)
+app = Quart(__name__)
 
-# Habilita CORS (permite chamadas de qualquer origem)
-# Em produção, você pode restringir para apenas liviamed.ai
-CORS(app, origins=[
+# Limite de upload: 20MB por arquivo (+ folga para o envelope multipart)
+# O padrão do Quart (16MB) recusaria arquivos válidos
+MAX_FILE_SIZE = 20 * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE + 1024 * 1024
+
+# Leitura do upload em blocos de 64KB
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Acima deste tamanho o arquivo vai pela File API do Gemini em vez de inline
+INLINE_MAX_SIZE = 5 * 1024 * 1024
+
+# Redução antes do envio: PDFs escaneados viram JPEG (cinza, 150 DPI)
+# e imagens grandes são redimensionadas - menos bytes e tokens no Gemini
+RASTER_MIN_PDF_SIZE = 2 * 1024 * 1024
+RASTER_DPI = 150
+MAX_RASTER_PAGES = 20
+MAX_IMAGE_SIDE = 2000
+
+# Pool compartilhado para trabalho bloqueante (SQLite, PDF, imagens, embeddings)
+# fora do event loop - as threads só são criadas no primeiro uso (após o fork)
+BLOCKING_POOL = concurrent.futures.ThreadPoolExecutor(
+    max_workers=32,
+    thread_name_prefix="blocking"
+)
+
+# /extract_batch: máximo de arquivos por requisição e de chamadas simultâneas ao Gemini
+MAX_BATCH_FILES = 20
+BATCH_CONCURRENCY = 10
+
+# /extract_batch: limite total do corpo (vários arquivos na mesma requisição)
+MAX_BATCH_CONTENT_LENGTH = 50 * 1024 * 1024
+
+
+class UploadRequest(Request):
+    """
+    Request com limite de corpo por rota: o Quart só tem o MAX_CONTENT_LENGTH
+    global, mas /extract_batch recebe vários arquivos no mesmo corpo
+    """
+    
+    def __init__(self, method, scheme, path, *args, **kwargs):
+        if path == '/extract_batch':
+            kwargs['max_content_length'] = MAX_BATCH_CONTENT_LENGTH
+        super().__init__(method, scheme, path, *args, **kwargs)
+    
+    @property
+    def max_content_length(self):
+        if self.path == '/extract_batch':
+            return MAX_BATCH_CONTENT_LENGTH
+        return super().max_content_length
+
+
+app.request_class = UploadRequest
+
+# Habilita CORS apenas para os front-ends conhecidos
+PROD_ORIGINS = [
     "https://liviamed.ai",
-    "https://docdoor-livia-web-hmv-ebg7ekg4epfkf5az.brazilsouth-01.azurewebsites.net",
+    "https://docdoor-livia-web-hmv-ebg7ekg4epfkf5az.brazilsouth-01.azurewebsites.net"
+]
+
+# Desenvolvimento local (CORS_DEV=true): libera também o localhost
+DEV_ORIGINS = [
     "http://localhost:3000",
-    "http://localhost:5173",
-    "*"  # Remove em produção se quiser restringir
-])
+    "http://localhost:5173"
+]
+
+CORS_DEV = os.environ.get("CORS_DEV", "false").lower() == "true"
+
+# max_age: o navegador guarda o preflight (OPTIONS) por 24h
+app = cors(
+    app,
+    allow_origin=PROD_ORIGINS + DEV_ORIGINS if CORS_DEV else PROD_ORIGINS,
+    max_age=86400
+)
 
 # ============================================================
 # CONFIGURAÇÃO DO GEMINI
@@ -37,6 +117,16 @@ CORS(app, origins=[
 # A chave vem da variável de ambiente (configurada no Render)
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 
+# Modelo (configurável para testes A/B, ex: gemini-2.0-flash-lite)
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash-001")
+
+# Cliente único, reaproveitado entre requisições (mantém o pool de conexões TLS)
+GEMINI_CLIENT = genai.Client(api_key=GEMINI_API_KEY) if GEMINI_API_KEY else None
+
+# Versão dos prompts - altere ao editar SYSTEM_INSTRUCTION/USER_PROMPT
+# para invalidar o cache de respostas
+PROMPT_VERSION = "v1"
+
 # Prompts para o Gemini
 SYSTEM_INSTRUCTION = """
 Você é um assistente de triagem médica especializado em processamento de documentos clínicos.
@@ -70,102 +160,442 @@ Use abreviações médicas padrão. Seja conciso e objetivo.
 Se não houver conteúdo clínico (ex: fatura, documento administrativo), indique claramente.
 """
 
+# Configuração de geração (temperatura baixa para extração factual)
+# Imutável: criada uma vez e reaproveitada em todas as chamadas
+GEN_CONFIG = types.GenerateContentConfig(
+    temperature=0.1,
+    max_output_tokens=2000,
+    system_instruction=SYSTEM_INSTRUCTION
+)
+
+# Retentativas em falhas temporárias do Gemini (429 / 5xx)
+GEMINI_MAX_ATTEMPTS = 3
+GEMINI_RETRY_MAX_WAIT = 10  # segundos (teto para o Retry-After)
+
+# Cache de contexto do Gemini: o prefixo estático (SYSTEM_INSTRUCTION + USER_PROMPT)
+# é enviado uma vez e referenciado pelo nome em cada chamada.
+# Desligado por padrão: o prefixo atual (~350 tokens) fica abaixo do mínimo que
+# os modelos aceitam para cache explícito. Ligue (GEMINI_CONTEXT_CACHE=true)
+# só se os prompts crescerem o suficiente.
+CONTEXT_CACHE_ENABLED = os.environ.get("GEMINI_CONTEXT_CACHE", "false").lower() == "true"
+CONTEXT_CACHE_CREATE_TIMEOUT = 10  # segundos
+CONTEXT_CACHE_TTL = 3600  # segundos
+CONTEXT_CACHE_REFRESH_MARGIN = 300  # renova 5 min antes de expirar
+
+_context_cache = {"config": None, "expires_at": 0.0}
+_context_cache_lock = asyncio.Lock()
+
 # ============================================================
 # FUNÇÕES AUXILIARES
 # ============================================================
 
-def get_mime_type(filename: str) -> str:
-    """Detecta o MIME type baseado na extensão do arquivo"""
-    ext = filename.lower().split('.')[-1] if '.' in filename else ''
-    mime_map = {
-        'pdf': 'application/pdf',
-        'png': 'image/png',
-        'jpg': 'image/jpeg',
-        'jpeg': 'image/jpeg',
-        'gif': 'image/gif',
-        'webp': 'image/webp',
-        'tiff': 'image/tiff',
-        'tif': 'image/tiff',
-        'bmp': 'image/bmp'
-    }
-    return mime_map.get(ext, 'application/octet-stream')
-
-
-def validate_file(filename: str, file_size: int) -> tuple:
+# MIME type por extensão
+MIME_MAP = {
+    'pdf': 'application/pdf',
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+    'tiff': 'image/tiff',
+    'tif': 'image/tiff',
+    'bmp': 'image/bmp'
+}
+
+# Extensões permitidas
+ALLOWED_EXTS = frozenset({'pdf', 'png', 'jpg', 'jpeg', 'gif', 'webp', 'tiff', 'tif', 'bmp'})
+
+
+def classify(filename: str) -> tuple:
+    """Extrai extensão, MIME type e se o formato é permitido (uma única passada)"""
+    ext = os.path.splitext(filename)[1][1:].lower()
+    return ext, MIME_MAP.get(ext, 'application/octet-stream'), ext in ALLOWED_EXTS
+
+
+def validate_file(ext: str, is_allowed: bool, file_size: int) -> tuple:
     """Valida o arquivo antes de processar"""
-    # Extensões permitidas
-    allowed = {'pdf', 'png', 'jpg', 'jpeg', 'gif', 'webp', 'tiff', 'tif', 'bmp'}
-    ext = filename.lower().split('.')[-1] if '.' in filename else ''
-    
-    if ext not in allowed:
+    if not is_allowed:
         return False, f"Formato .{ext} não suportado. Use: PDF, PNG, JPG, etc."
     
     # Limite de 20MB
-    max_size = 20 * 1024 * 1024
-    if file_size > max_size:
+    if file_size > MAX_FILE_SIZE:
         return False, f"Arquivo muito grande ({file_size / 1024 / 1024:.1f}MB). Limite: 20MB"
     
     return True, ""
 
 
-def process_with_gemini(file_bytes: bytes, mime_type: str) -> str:
-    """Processa o documento com Gemini 1.5 Flash"""
+async def run_blocking(func, *args):
+    """Executa uma função bloqueante no BLOCKING_POOL sem travar o event loop"""
+    return await asyncio.get_running_loop().run_in_executor(BLOCKING_POOL, func, *args)
+
+
+def read_upload(stream) -> tuple:
+    """
+    Lê o upload em blocos, calculando o SHA-256 durante a leitura
     
-    # Inicializa cliente Gemini
-    client = genai.Client(api_key=GEMINI_API_KEY)
+    Os blocos são juntados uma única vez no final. O resultado é bytes
+    (imutável), que io.BytesIO e o SDK do Gemini reaproveitam sem copiar.
     
-    # Cria a parte do arquivo
-    file_part = types.Part.from_bytes(
-        data=file_bytes,
-        mime_type=mime_type
-    )
+    Retorna (bytes, sha256 hex), ou (None, None) se passar de MAX_FILE_SIZE
+    """
+    chunks = []
+    digest = hashlib.sha256()
+    total = 0
     
-    # Configuração de geração (temperatura baixa para extração factual)
-    config = types.GenerateContentConfig(
-        temperature=0.1,
-        max_output_tokens=2000
-    )
+    while chunk := stream.read(UPLOAD_CHUNK_SIZE):
+        total += len(chunk)
+        if total > MAX_FILE_SIZE:
+            return None, None
+        digest.update(chunk)
+        chunks.append(chunk)
+    
+    return b"".join(chunks), digest.hexdigest()
+
+
+def extract_pdf_text(file_bytes: bytes, max_pages: int = 2) -> str:
+    """Extrai a camada de texto das primeiras páginas do PDF (vazio se for só imagem)"""
+    try:
+        with pymupdf.open(stream=file_bytes, filetype="pdf") as doc:
+            pages = range(min(max_pages, doc.page_count))
+            return "".join(doc[i].get_text() for i in pages).strip()
+    except Exception as e:
+        logger.warning(f"Falha ao ler texto do PDF: {e}")
+        return ""
+
+
+async def get_context_cache():
+    """
+    Retorna a configuração de geração que referencia o cache de contexto dos
+    prompts, criando/renovando o cache quando perto de expirar. Retorna None
+    se o cache estiver desligado, sendo renovado por outra requisição ou não
+    puder ser criado - nesse caso os prompts vão completos na requisição e,
+    após uma falha, a criação só é tentada de novo após o TTL.
+    """
+    if not CONTEXT_CACHE_ENABLED:
+        return None
+    
+    def is_fresh():
+        return time.time() < _context_cache["expires_at"] - CONTEXT_CACHE_REFRESH_MARGIN
+    
+    if is_fresh():
+        return _context_cache["config"]
     
-    # Chama o Gemini
-    response = client.models.generate_content(
-        model='gemini-1.5-flash',
-        contents=[file_part, USER_PROMPT],
-        config=config,
-        system_instruction=SYSTEM_INSTRUCTION
+    # Outra requisição já está renovando: não espera, segue com os prompts completos
+    if _context_cache_lock.locked():
+        return None
+    
+    async with _context_cache_lock:
+        if not is_fresh():
+            try:
+                cache = await asyncio.wait_for(
+                    GEMINI_CLIENT.aio.caches.create(
+                        model=GEMINI_MODEL,
+                        config=types.CreateCachedContentConfig(
+                            system_instruction=SYSTEM_INSTRUCTION,
+                            contents=[USER_PROMPT],
+                            ttl=f"{CONTEXT_CACHE_TTL}s"
+                        )
+                    ),
+                    timeout=CONTEXT_CACHE_CREATE_TIMEOUT
+                )
+                # Mesma configuração, mas com os prompts vindo do cache
+                _context_cache["config"] = GEN_CONFIG.model_copy(update={
+                    "system_instruction": None,
+                    "cached_content": cache.name
+                })
+                logger.info(f"Cache de contexto criado: {cache.name}")
+            except Exception as e:
+                _context_cache["config"] = None
+                logger.warning(f"Cache de contexto indisponível, enviando prompts completos: {e!r}")
+            _context_cache["expires_at"] = time.time() + CONTEXT_CACHE_TTL
+    
+    return _context_cache["config"]
+
+
+def rasterize_pdf(file_bytes: bytes) -> list:
+    """
+    Renderiza um PDF escaneado em uma imagem JPEG (cinza) por página
+    
+    Retorna [] se o PDF tiver camada de texto ou mais de MAX_RASTER_PAGES
+    páginas (nesse caso o original é enviado, para não perder páginas)
+    """
+    with pymupdf.open(stream=file_bytes, filetype="pdf") as doc:
+        if doc.page_count > MAX_RASTER_PAGES:
+            return []
+        if any(page.get_text().strip() for page in doc):
+            return []
+        return [
+            (page.get_pixmap(dpi=RASTER_DPI, colorspace=pymupdf.csGRAY).tobytes("jpeg", jpg_quality=80), 'image/jpeg')
+            for page in doc
+        ]
+
+
+def shrink_image(file_bytes: bytes, mime_type: str) -> tuple:
+    """Reduz imagens com lado maior que MAX_IMAGE_SIDE (mantém cor e orientação)"""
+    with Image.open(io.BytesIO(file_bytes)) as img:
+        # Imagens com várias páginas (ex: TIFF) seguem como estão
+        if max(img.size) <= MAX_IMAGE_SIDE or getattr(img, "n_frames", 1) > 1:
+            return file_bytes, mime_type
+        
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE))
+        
+        # JPEG não tem transparência: aplica sobre fundo branco (senão fica preto)
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        
+        out = io.BytesIO()
+        img.convert("RGB").save(out, format="JPEG", quality=85)
+        
+        # Scans limpos em PNG podem crescer como JPEG: mantém o original
+        if out.tell() >= len(file_bytes):
+            return file_bytes, mime_type
+        return out.getvalue(), 'image/jpeg'
+
+
+def prepare_document(file_bytes: bytes, mime_type: str) -> list:
+    """
+    Prepara o documento para o Gemini, reduzindo PDFs escaneados e imagens grandes
+    
+    Retorna lista de (bytes, mime_type) - em caso de falha, o arquivo original
+    """
+    try:
+        if mime_type == 'application/pdf' and len(file_bytes) > RASTER_MIN_PDF_SIZE:
+            pages = rasterize_pdf(file_bytes)
+            if pages and sum(len(data) for data, _ in pages) < len(file_bytes):
+                logger.info(f"PDF escaneado convertido em {len(pages)} imagem(ns)")
+                return pages
+        elif mime_type.startswith('image/'):
+            return [shrink_image(file_bytes, mime_type)]
+    except Exception as e:
+        logger.warning(f"Falha ao reduzir documento, enviando original: {e}")
+    
+    return [(file_bytes, mime_type)]
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """Erros temporários do Gemini: cota excedida (429) e erros de servidor (5xx)"""
+    if isinstance(exc, errors.ServerError):
+        return True
+    return isinstance(exc, errors.ClientError) and exc.code == 429
+
+
+_backoff = wait_random_exponential(multiplier=0.5, max=4)
+
+
+def retry_wait(retry_state) -> float:
+    """Respeita o Retry-After do Gemini; sem ele, backoff exponencial com jitter"""
+    exc = retry_state.outcome.exception()
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    retry_after = headers.get("retry-after", "")
+    if retry_after.isdigit():
+        return min(float(retry_after), GEMINI_RETRY_MAX_WAIT)
+    return _backoff(retry_state)
+
+
+@retry(
+    stop=stop_after_attempt(GEMINI_MAX_ATTEMPTS),
+    wait=retry_wait,
+    retry=retry_if_exception(is_transient_error),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True
+)
+async def generate_content(contents: list, config):
+    """Chama o Gemini, repetindo em falhas temporárias (o arquivo não é reenviado pelo cliente)"""
+    return await GEMINI_CLIENT.aio.models.generate_content(
+        model=GEMINI_MODEL,
+        contents=contents,
+        config=config
     )
+
+
+async def delete_uploaded_file(name: str) -> None:
+    """Remove um arquivo da File API (falhas só geram log)"""
+    try:
+        await GEMINI_CLIENT.aio.files.delete(name=name)
+    except Exception as e:
+        logger.warning(f"Falha ao remover arquivo {name} da File API: {e}")
+
+
+async def process_with_gemini(file_bytes: bytes, mime_type: str) -> str:
+    """Processa o documento com Gemini (sem bloquear o worker)"""
+    
+    # Reduz o documento (CPU) fora do event loop
+    pages = await run_blocking(prepare_document, file_bytes, mime_type)
+    
+    # Configuração de geração
+    config = await get_context_cache()
+    
+    uploaded = []
+    try:
+        # Cria as partes do arquivo
+        if sum(len(data) for data, _ in pages) > INLINE_MAX_SIZE:
+            # Acima do limite (arquivo único ou várias páginas somadas) vai tudo
+            # pela File API (upload resumível, sem base64 no JSON)
+            results = await asyncio.gather(*[
+                GEMINI_CLIENT.aio.files.upload(
+                    file=io.BytesIO(data),
+                    config=types.UploadFileConfig(mime_type=part_mime_type)
+                )
+                for data, part_mime_type in pages
+            ], return_exceptions=True)
+            uploaded = [r for r in results if not isinstance(r, BaseException)]
+            for r in results:
+                if isinstance(r, BaseException):
+                    raise r
+            file_parts = uploaded
+        else:
+            file_parts = [
+                types.Part.from_bytes(data=data, mime_type=part_mime_type)
+                for data, part_mime_type in pages
+            ]
+        
+        if config is not None:
+            # Prompts já estão no cache de contexto: envia só o arquivo
+            contents = file_parts
+        else:
+            contents = [*file_parts, USER_PROMPT]
+            config = GEN_CONFIG
+        
+        # Chama o Gemini (API assíncrona do SDK, com retentativas)
+        response = await generate_content(contents, config)
+    finally:
+        # Remove os arquivos enviados pela File API (não guardamos documentos clínicos)
+        if uploaded:
+            await asyncio.gather(*[delete_uploaded_file(f.name) for f in uploaded])
     
     return response.text.strip()
 
 
+async def analyze_document(file) -> tuple:
+    """
+    Processa um arquivo enviado: leitura, validação, cache e Gemini
+    
+    Retorna (corpo da resposta, status HTTP) - nunca lança exceção
+    """
+    try:
+        # Lê o arquivo (aborta assim que passar do limite) no pool: a leitura do
+        # arquivo temporário e o SHA-256 liberam o GIL e não travam o event loop
+        file_bytes, file_hash = await run_blocking(read_upload, file.stream)
+        filename = file.filename
+        
+        if file_bytes is None:
+            return {
+                "success": False,
+                "error": "FILE_TOO_LARGE",
+                "message": "Arquivo muito grande. Limite: 20MB"
+            }, 413
+        
+        logger.info(f"Processando arquivo: {filename} ({len(file_bytes)} bytes)")
+        
+        # Valida
+        ext, mime_type, is_allowed = classify(filename)
+        is_valid, error_msg = validate_file(ext, is_allowed, len(file_bytes))
+        if not is_valid:
+            return {
+                "success": False,
+                "error": "INVALID_FILE",
+                "message": error_msg
+            }, 400
+        
+        # Consulta o cache (mesmo arquivo + mesma versão do prompt e modelo)
+        cache_key = f"{file_hash}:{PROMPT_VERSION}:{GEMINI_MODEL}"
+        result_text = await run_blocking(llm_cache.get, cache_key)
+        cached = result_text is not None
+        
+        embedding = None
+        if not cached and mime_type == 'application/pdf':
+            pdf_text = await run_blocking(extract_pdf_text, file_bytes)
+            
+            # Pré-filtro: documento claramente administrativo não vai para o Gemini
+            reason = prefilter.non_clinical_reason(pdf_text)
+            if reason:
+                logger.info(f"Pré-filtro: {filename} não clínico ({reason})")
+                result_text = f"NOT_CLINICAL: {reason}"
+            
+            # Cache semântico: usa o texto do PDF como proxy do documento.
+            # Hit semântico não vai para o cache exato: a resposta é de outro arquivo.
+            elif semantic_cache.ENABLED and len(pdf_text) >= 200:
+                result_text, embedding = await run_blocking(semantic_cache.lookup, pdf_text)
+                cached = result_text is not None
+        
+        # Processa com Gemini apenas se não estiver em cache nem foi filtrado
+        if result_text is None:
+            result_text = await process_with_gemini(file_bytes, mime_type)
+            await run_blocking(llm_cache.set, cache_key, result_text)
+            if embedding is not None:
+                await run_blocking(semantic_cache.store, embedding, result_text)
+        
+        # Verifica se é conteúdo não-clínico (compara só o prefixo, sem copiar a resposta inteira)
+        if result_text[:12].upper() == "NOT_CLINICAL":
+            reason = result_text.split(":", 1)[-1].strip() if ":" in result_text else "Documento não clínico"
+            return {
+                "success": False,
+                "error": "NOT_CLINICAL",
+                "message": f"Documento não contém informações clínicas: {reason}"
+            }, 200  # 200 porque processou corretamente
+        
+        # Sucesso!
+        return {
+            "success": True,
+            "message": result_text,
+            "metadata": {
+                "filename": filename,
+                "size_bytes": len(file_bytes),
+                "mime_type": mime_type,
+                "cached": cached
+            }
+        }, 200
+        
+    except Exception as e:
+        logger.exception(f"Erro ao processar: {e}")
+        return {
+            "success": False,
+            "error": "PROCESSING_ERROR",
+            "message": "Erro ao processar documento. Tente novamente."
+        }, 500
+
+
 # ============================================================
 # ROTAS DA API
 # ============================================================
 
+def ojson(data: dict, status: int = 200):
+    """Resposta JSON serializada com orjson (bem mais rápido que o json padrão)"""
+    return app.response_class(orjson.dumps(data), status=status, mimetype='application/json')
+
+
 @app.route('/', methods=['GET'])
-def home():
+async def home():
     """Rota de verificação - mostra que a API está funcionando"""
-    return jsonify({
+    return ojson({
         "status": "online",
         "service": "Clinical Aggregator API",
         "version": "1.0.0",
         "endpoints": {
             "POST /extract": "Extrai texto de documento clínico",
+            "POST /extract_batch": "Extrai texto de vários documentos clínicos",
             "GET /health": "Verifica status da API"
         }
     })
 
 
 @app.route('/health', methods=['GET'])
-def health():
+async def health():
     """Health check - útil para monitoramento"""
-    return jsonify({
+    return ojson({
         "status": "healthy",
-        "gemini_configured": bool(GEMINI_API_KEY)
+        "gemini_configured": bool(GEMINI_API_KEY),
+        "cache": dict(llm_cache.stats),
+        "semantic_cache": dict(semantic_cache.stats, enabled=semantic_cache.ENABLED)
     })
 
 
 @app.route('/extract', methods=['POST', 'OPTIONS'])
-def extract():
+async def extract():
     """
     Endpoint principal - extrai texto de documento clínico
     
@@ -184,91 +614,114 @@ def extract():
     # Verifica se Gemini está configurado
     if not GEMINI_API_KEY:
         logger.error("GEMINI_API_KEY não configurada")
-        return jsonify({
+        return ojson({
             "success": False,
             "error": "CONFIG_ERROR",
             "message": "API não configurada corretamente. Contate o administrador."
-        }), 500
+        }, 500)
     
     # Verifica se arquivo foi enviado
-    if 'file' not in request.files:
-        return jsonify({
+    files = await request.files
+    if 'file' not in files:
+        return ojson({
             "success": False,
             "error": "NO_FILE",
             "message": "Nenhum arquivo enviado. Envie um arquivo no campo 'file'."
-        }), 400
+        }, 400)
     
-    file = request.files['file']
+    file = files['file']
     
     # Verifica se tem nome
     if file.filename == '':
-        return jsonify({
+        return ojson({
             "success": False,
             "error": "NO_FILE",
             "message": "Arquivo sem nome."
-        }), 400
+        }, 400)
     
-    try:
-        # Lê o arquivo
-        file_bytes = file.read()
-        filename = file.filename
-        
-        logger.info(f"Processando arquivo: {filename} ({len(file_bytes)} bytes)")
-        
-        # Valida
-        is_valid, error_msg = validate_file(filename, len(file_bytes))
-        if not is_valid:
-            return jsonify({
-                "success": False,
-                "error": "INVALID_FILE",
-                "message": error_msg
-            }), 400
-        
-        # Detecta MIME type
-        mime_type = get_mime_type(filename)
-        
-        # Processa com Gemini
-        result_text = process_with_gemini(file_bytes, mime_type)
-        
-        # Verifica se é conteúdo não-clínico
-        if result_text.upper().startswith("NOT_CLINICAL"):
-            reason = result_text.split(":", 1)[-1].strip() if ":" in result_text else "Documento não clínico"
-            return jsonify({
-                "success": False,
-                "error": "NOT_CLINICAL",
-                "message": f"Documento não contém informações clínicas: {reason}"
-            }), 200  # 200 porque processou corretamente
-        
-        # Sucesso!
-        return jsonify({
-            "success": True,
-            "message": result_text,
-            "metadata": {
-                "filename": filename,
-                "size_bytes": len(file_bytes),
-                "mime_type": mime_type
-            }
-        }), 200
-        
-    except Exception as e:
-        logger.exception(f"Erro ao processar: {e}")
-        return jsonify({
+    body, status = await analyze_document(file)
+    return ojson(body, status)
+
+
+@app.route('/extract_batch', methods=['POST', 'OPTIONS'])
+async def extract_batch():
+    """
+    Extrai texto de vários documentos clínicos em uma única requisição
+    
+    Envie os arquivos via multipart/form-data no campo 'files' (repetido).
+    As chamadas ao Gemini são feitas em paralelo (até BATCH_CONCURRENCY).
+    Cada arquivo segue o limite de 20MB; o corpo inteiro, MAX_BATCH_CONTENT_LENGTH.
+    
+    Resposta:
+    - success: true (a requisição foi processada)
+    - results: lista com filename, success, message e error/metadata por arquivo
+    """
+    
+    # Handle preflight CORS
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    # Verifica se Gemini está configurado
+    if not GEMINI_API_KEY:
+        logger.error("GEMINI_API_KEY não configurada")
+        return ojson({
             "success": False,
-            "error": "PROCESSING_ERROR",
-            "message": "Erro ao processar documento. Tente novamente."
-        }), 500
+            "error": "CONFIG_ERROR",
+            "message": "API não configurada corretamente. Contate o administrador."
+        }, 500)
+    
+    # Verifica se arquivos foram enviados (ignora campos sem nome)
+    files = [f for f in (await request.files).getlist('files') if f.filename]
+    if not files:
+        return ojson({
+            "success": False,
+            "error": "NO_FILE",
+            "message": "Nenhum arquivo enviado. Envie os arquivos no campo 'files'."
+        }, 400)
+    
+    if len(files) > MAX_BATCH_FILES:
+        return ojson({
+            "success": False,
+            "error": "TOO_MANY_FILES",
+            "message": f"Muitos arquivos ({len(files)}). Limite: {MAX_BATCH_FILES} por requisição"
+        }, 400)
+    
+    # Processa em paralelo, limitando as chamadas simultâneas ao Gemini
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def run(file):
+        async with semaphore:
+            body, _ = await analyze_document(file)
+        return {"filename": file.filename, **body}
+    
+    results = await asyncio.gather(*[run(f) for f in files])
+    
+    return ojson({
+        "success": True,
+        "results": results
+    }, 200)
+
+
+@app.errorhandler(413)
+async def request_too_large(error):
+    """Upload acima do limite da rota (recusado antes de ser lido inteiro)"""
+    if request.path == '/extract_batch':
+        message = "Lote muito grande. Limite: 50MB somando todos os arquivos"
+    else:
+        message = "Arquivo muito grande. Limite: 20MB"
+    
+    return ojson({
+        "success": False,
+        "error": "FILE_TOO_LARGE",
+        "message": message
+    }, 413)
 
 
 # ============================================================
 # INICIALIZAÇÃO
 # ============================================================
 
-if __name__ == '__main__':
-    # Porta vem da variável de ambiente (Render define automaticamente)
-    port = int(os.environ.get('PORT', 5000))
-    
-    # Debug apenas em desenvolvimento local
-    debug = os.environ.get('FLASK_DEBUG', 'false').lower() == 'true'
-    
-    logger.info(f"Iniciando servidor na porta {port}")
-    app.run(host='0.0.0.0', port=port, debug=debug)
+# Em produção o servidor é o Gunicorn (ver gunicorn.conf.py / Procfile):
+#   gunicorn app:app
+# Desenvolvimento local:
+#   quart --app app run --debug
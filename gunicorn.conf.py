@@ -0,0 +1,31 @@
+# ============================================================
+# Configuração do Gunicorn (produção)
+# Uso: gunicorn app:app  (este arquivo é carregado automaticamente)
+# ============================================================
+
+import os
+
+# Porta vem da variável de ambiente (Render define automaticamente)
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# App é ASGI (Quart): cada worker uvicorn atende várias requisições
+# simultâneas enquanto espera o Gemini - não é preciso usar threads.
+# Também não usamos gevent: o monkey-patching conflita com o asyncio e o
+# event loop já multiplexa milhares de chamadas ao Gemini por worker.
+# Por isso o padrão é fixo e pequeno (2), e não a fórmula 2*CPU+1 dos
+# workers síncronos: em container cpu_count() enxerga os núcleos do host e
+# cada worker consome memória (PyMuPDF, FAISS...). Ajuste com WEB_CONCURRENCY.
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Com UvicornWorker o timeout NÃO limita a duração da requisição: é o
+# heartbeat do worker. Se o event loop ficar travado por mais tempo que isso,
+# o Gunicorn mata e recria o worker. Chamadas lentas ao Gemini não contam
+# (o loop segue livre enquanto espera); PDF/imagem rodam no BLOCKING_POOL.
+timeout = 120
+
+# Importa o app (SDK do Gemini, GEMINI_CLIENT, índice FAISS) uma vez no processo
+# principal e faz fork: os workers já nascem prontos (copy-on-write).
+# Por isso app.py não pode abrir conexões no import - o cache de contexto,
+# o SQLite e o modelo de embeddings são inicializados no primeiro uso.
+preload_app = True
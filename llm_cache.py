@@ -0,0 +1,103 @@
+# ============================================================
+# Cache de respostas do Gemini
+# Cache exato (content-addressed): chave = sha256 do arquivo + versão do prompt
+# Persistido em SQLite (funciona no disco persistente do Render)
+# ============================================================
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Caminho do banco (no Render, aponte para o disco persistente, ex: /var/data/llm_cache.db)
+CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "llm_cache.db")
+
+# TTL padrão: 7 dias
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+# Limpeza das entradas expiradas: no máximo uma vez a cada 10 minutos (em set())
+SWEEP_INTERVAL = 10 * 60
+
+# Contadores do processo atual (expostos no /health)
+stats = {"hits": 0, "misses": 0}
+
+_stats_lock = threading.Lock()
+_local = threading.local()
+_sweep_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+def _connect() -> sqlite3.Connection:
+    """Abre (uma vez por thread) a conexão com o banco do cache"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(CACHE_PATH, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS llm_cache_expires_at ON llm_cache (expires_at)"
+        )
+        _local.conn = conn
+    return conn
+
+
+def _count(field: str) -> None:
+    with _stats_lock:
+        stats[field] += 1
+
+
+def _sweep(conn: sqlite3.Connection) -> None:
+    """Apaga as entradas expiradas (a maioria dos arquivos nunca é reenviada)"""
+    global _last_sweep
+    now = time.time()
+    with _sweep_lock:
+        if now - _last_sweep < SWEEP_INTERVAL:
+            return
+        _last_sweep = now
+
+    deleted = conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (now,)).rowcount
+    conn.commit()
+    if deleted:
+        logger.info(f"Cache: {deleted} entrada(s) expirada(s) removida(s)")
+
+
+def get(key: str):
+    """Retorna a resposta em cache para a chave, ou None se não existir/expirou"""
+    try:
+        conn = _connect()
+        row = conn.execute(
+            "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None and row[1] < time.time():
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            conn.commit()
+            row = None
+    except sqlite3.Error as e:
+        # Falha no cache nunca deve derrubar a requisição
+        logger.warning(f"Falha ao ler cache: {e}")
+        row = None
+
+    _count("hits" if row is not None else "misses")
+    return row[0] if row is not None else None
+
+
+def set(key: str, value: str, ttl: int = DEFAULT_TTL) -> None:
+    """Grava a resposta no cache com expiração (padrão: 7 dias)"""
+    try:
+        conn = _connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl)
+        )
+        conn.commit()
+        _sweep(conn)
+    except sqlite3.Error as e:
+        logger.warning(f"Falha ao gravar cache: {e}")
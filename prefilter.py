@@ -0,0 +1,61 @@
+# ============================================================
+# Pré-filtro de documentos não clínicos
+# Detecta documentos claramente administrativos (nota fiscal, boleto...)
+# pelo texto do PDF, sem chamar o Gemini
+# ============================================================
+#
+# Regra conservadora: só marca como não clínico quando há vários termos
+# administrativos E nenhum termo clínico. Na dúvida, o Gemini decide.
+
+import re
+import unicodedata
+
+# Termos administrativos/financeiros (minúsculo, sem acento)
+ADMIN_TERMS = [
+    "nota fiscal", "danfe", "chave de acesso", "inscricao estadual", "icms",
+    "boleto", "linha digitavel", "codigo de barras", "nosso numero",
+    "cedente", "sacado", "vencimento", "valor total", "valor a pagar",
+    "fatura", "recibo", "cnpj"
+]
+
+# Termos clínicos (minúsculo, sem acento) - qualquer um deles libera o documento
+CLINICAL_TERMS = [
+    "paciente", "prontuario", "anamnese", "queixa", "diagnostico", "hipotese",
+    "cid", "crm", "exame", "exames", "laudo", "hemograma", "pressao arterial",
+    "sintoma", "sintomas", "alergia", "alergias", "medicacao", "medicamento",
+    "prescricao", "receituario", "posologia", "mg", "conduta", "evolucao",
+    "tratamento", "internacao"
+]
+
+# Mínimo de termos administrativos distintos para rejeitar
+MIN_ADMIN_TERMS = 2
+
+
+def _pattern(terms: list):
+    return re.compile(r"\b(" + "|".join(re.escape(t) for t in terms) + r")\b")
+
+
+_ADMIN_RE = _pattern(ADMIN_TERMS)
+_CLINICAL_RE = _pattern(CLINICAL_TERMS)
+
+
+def _normalize(text: str) -> str:
+    """Minúsculo e sem acentos"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def non_clinical_reason(text: str):
+    """Retorna o motivo se o texto for claramente não clínico, ou None"""
+    if not text:
+        return None
+
+    normalized = _normalize(text)
+    if _CLINICAL_RE.search(normalized):
+        return None
+
+    found = sorted(set(_ADMIN_RE.findall(normalized)))
+    if len(found) < MIN_ADMIN_TERMS:
+        return None
+
+    return f"documento administrativo ({', '.join(found)})"
@@ -0,0 +1,170 @@
+# ============================================================
+# Cache semântico de respostas do Gemini
+# Encontra documentos quase idênticos (ex: mesmo PDF re-gerado,
+# metadados diferentes) via embeddings + busca vetorial (FAISS)
+# ============================================================
+#
+# Dependências opcionais: faiss-cpu e sentence-transformers.
+# Desativado por padrão - ative com SEMANTIC_CACHE_ENABLED=true.
+#
+# ATENÇÃO: documentos de pacientes diferentes com o mesmo modelo
+# (ex: laudos do mesmo laboratório) podem ficar muito próximos.
+# Ajuste SEMANTIC_CACHE_THRESHOLD com cuidado.
+
+import os
+import math
+import time
+import logging
+import threading
+
+try:
+    import faiss
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    faiss = None
+
+logger = logging.getLogger(__name__)
+
+# Só liga se a flag estiver ativa E as dependências instaladas
+ENABLED = (
+    os.environ.get("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    and faiss is not None
+)
+
+# Modelo multilíngue (português) com vetores de 768 dimensões
+MODEL_NAME = os.environ.get(
+    "SEMANTIC_CACHE_MODEL",
+    "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+)
+EMBEDDING_DIM = 768
+
+# O modelo trunca a entrada em 128 word-pieces: embedar o texto inteiro só
+# compararia o cabeçalho (timbre do laboratório). O texto é dividido em
+# trechos e cada trecho precisa bater com o trecho correspondente.
+CHUNK_WORDS = 80
+MAX_CHUNKS = 64
+
+# Similaridade de cosseno mínima para considerar um hit
+THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+
+# Eviction LFU + recência: psi = ALPHA * freq + (1 - ALPHA) * exp(-idade / BETA)
+MAX_ENTRIES = 500
+ALPHA = 0.5
+BETA = 3600.0  # segundos
+
+# Contadores do processo atual (expostos no /health)
+stats = {"hits": 0, "misses": 0, "entries": 0}
+
+_lock = threading.Lock()
+_model = None
+
+# Índice criado no import (pronto antes do fork com gunicorn --preload).
+# O modelo fica para o primeiro uso em cada worker: carregar torch antes
+# do fork pode travar os workers.
+_index = faiss.IndexFlatIP(EMBEDDING_DIM) if ENABLED else None
+_entries = []  # paralelo ao índice: {"embedding", "chunks", "response", "freq", "last_used"}
+
+
+def _get_model():
+    """Carrega o modelo de embeddings na primeira utilização"""
+    global _model
+    with _lock:
+        if _model is None:
+            logger.info(f"Carregando modelo de embeddings: {MODEL_NAME}")
+            _model = SentenceTransformer(MODEL_NAME)
+    return _model
+
+
+def _chunks(text: str) -> list:
+    """Divide o texto em trechos de CHUNK_WORDS palavras (amostra espaçada se passar de MAX_CHUNKS)"""
+    words = text.split()
+    chunks = [" ".join(words[i:i + CHUNK_WORDS]) for i in range(0, len(words), CHUNK_WORDS)]
+    if len(chunks) > MAX_CHUNKS:
+        step = len(chunks) / MAX_CHUNKS
+        chunks = [chunks[int(i * step)] for i in range(MAX_CHUNKS)]
+    return chunks
+
+
+def _embed(text: str):
+    """Gera os embeddings normalizados (L2) de cada trecho - produto interno = cosseno"""
+    vectors = _get_model().encode(_chunks(text)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _mean(vectors):
+    """Vetor do documento no índice: média normalizada dos trechos"""
+    mean = vectors.mean(axis=0, keepdims=True)
+    faiss.normalize_L2(mean)
+    return mean
+
+
+def _same_document(a, b) -> bool:
+    """Todos os trechos alinhados precisam passar do THRESHOLD (não só o cabeçalho)"""
+    return a.shape == b.shape and float((a * b).sum(axis=1).min()) >= THRESHOLD
+
+
+def _evict() -> None:
+    """Remove a entrada de menor score (psi) e reconstrói o índice"""
+    now = time.time()
+    max_freq = max(entry["freq"] for entry in _entries)
+
+    def score(entry):
+        recency = math.exp(-(now - entry["last_used"]) / BETA)
+        return ALPHA * entry["freq"] / max_freq + (1 - ALPHA) * recency
+
+    victim = min(range(len(_entries)), key=lambda i: score(_entries[i]))
+    del _entries[victim]
+
+    # IndexFlatIP é pequeno (<= 500 vetores): reconstruir é barato
+    _index.reset()
+    _index.add(np.vstack([entry["embedding"] for entry in _entries]))
+
+
+def lookup(text: str) -> tuple:
+    """
+    Procura uma resposta para um documento semanticamente equivalente
+
+    Retorna (resposta ou None, embeddings) - os embeddings são reaproveitados em store()
+    """
+    try:
+        chunks = _embed(text)
+
+        with _lock:
+            if _index.ntotal > 0:
+                scores, ids = _index.search(_mean(chunks), 1)
+                entry = _entries[ids[0][0]]
+                if scores[0][0] >= THRESHOLD and _same_document(entry["chunks"], chunks):
+                    entry["freq"] += 1
+                    entry["last_used"] = time.time()
+                    stats["hits"] += 1
+                    return entry["response"], chunks
+
+            stats["misses"] += 1
+            return None, chunks
+    except Exception as e:
+        # Falha no cache (download do modelo, FAISS...) nunca deve derrubar a requisição
+        logger.warning(f"Falha ao consultar cache semântico: {e}")
+        return None, None
+
+
+def store(chunks, response: str) -> None:
+    """Adiciona a resposta do Gemini ao cache semântico"""
+    try:
+        with _lock:
+            if len(_entries) >= MAX_ENTRIES:
+                _evict()
+
+            embedding = _mean(chunks)
+            _index.add(embedding)
+            _entries.append({
+                "embedding": embedding[0],
+                "chunks": chunks,
+                "response": response,
+                "freq": 1,
+                "last_used": time.time()
+            })
+            stats["entries"] = len(_entries)
+    except Exception as e:
+        logger.warning(f"Falha ao gravar cache semântico: {e}")